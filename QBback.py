@@ -1,17 +1,32 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import sqlite3
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
 import json
-import io
-from typing import List, Dict, Any, Optional
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple
 import uvicorn
 import logging
 import os
 import re
+import time
+import hashlib
+import queue
+import threading
+import io
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from dataclasses import dataclass
 from dotenv import load_dotenv  # Add this import
+from cachetools import TTLCache
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 logging.basicConfig(level=logging.INFO)
@@ -39,7 +54,26 @@ load_dotenv()  # Add this line
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Data Analytics API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app):
+    """Run the Gemini workers that bound concurrent model requests for the lifetime of the app"""
+    global gemini_queue, gemini_worker_tasks
+    gemini_queue = asyncio.Queue()
+    gemini_worker_tasks = [asyncio.create_task(gemini_worker(gemini_queue)) for _ in range(GEMINI_CONCURRENCY)]
+    logger.info(f"Gemini workers started (concurrency {GEMINI_CONCURRENCY})")
+    try:
+        yield
+    finally:
+        for task in gemini_worker_tasks:
+            task.cancel()
+        await asyncio.gather(*gemini_worker_tasks, return_exceptions=True)
+        # Fail any handlers still waiting on jobs nobody will run
+        while not gemini_queue.empty():
+            gemini_queue.get_nowait()[-1].cancel()
+        gemini_queue, gemini_worker_tasks = None, []
+        logger.info("Gemini workers stopped")
+
+app = FastAPI(title="Data Analytics API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware to allow requests from React app
 app.add_middleware(
@@ -55,6 +89,7 @@ class QueryRequest(BaseModel):
     query: str
     table_name: str = "Data"
     api_key: Optional[str] = None
+    use_cache: bool = True  # Set to False to bypass the generated-SQL cache
 
 class QueryResponse(BaseModel):
     success: bool
@@ -64,6 +99,7 @@ class QueryResponse(BaseModel):
     sql_query: Optional[str] = None
     message: Optional[str] = None
     ai_summary: Optional[str] = None  # Add AI summary field
+    truncated: bool = False  # True when the result was cut off at MAX_RESULT_ROWS
 
 class GeminiSettings(BaseModel):
     model: str = "gemini-2.5-flash"
@@ -79,9 +115,34 @@ class SampleQuestionsResponse(BaseModel):
     data_type: str
     columns_analyzed: List[str]
 
+@dataclass
+class DatasetProfile:
+    """Column statistics computed once per upload and reused by every endpoint"""
+    numeric_cols: List[str]
+    categorical_cols: List[str]
+    dtypes_str: Dict[str, str]
+    missing_counts: Dict[str, int]
+    value_counts_top10_by_col: Dict[str, Dict[str, int]]
+    sample_records: List[Dict[str, Any]]
+
+@dataclass
+class UploadState:
+    """Everything derived from one upload, published to the endpoints in a single assignment"""
+    generation: int  # increases with every upload; scopes per-upload caches
+    dataframe: pd.DataFrame
+    table_name: str
+    schema_fp: str  # fingerprint of the uploaded CSV's column names and dtypes
+    profile: DatasetProfile
+    # detect_data_type_and_context results
+    context: str
+    confidence: float
+    column_names: List[str]
+
 # Global variables to store data
-current_dataframe: Optional[pd.DataFrame] = None
-current_connection: Optional[sqlite3.Connection] = None
+current_upload: Optional[UploadState] = None  # read once per request so a handler sees a single dataset
+current_connection: Optional[sqlite3.Connection] = None  # read-write, used only for ingest
+upload_generation = 0
+_upload_lock = asyncio.Lock()  # one /upload-csv at a time, from parsing to publishing
 
 # Default API key - now properly loaded from .env file
 DEFAULT_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -92,6 +153,41 @@ if DEFAULT_API_KEY:
 else:
     logger.warning("No GEMINI_API_KEY found in environment variables")
 
+# Seconds a Gemini connection test result (or a successful real call) is trusted before probing again
+HEALTH_CHECK_TTL = 300
+
+# SQLite database file: one read-write connection for ingest, a pool of read-only ones for queries
+DB_PATH = os.getenv("QUERYBOT_DB_PATH", "qb.db")
+READ_POOL_SIZE = int(os.getenv("QUERYBOT_READ_POOL_SIZE", "4"))
+read_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+_read_pool_ready = False
+_read_pool_lock = threading.Lock()
+# Serializes ingests: concurrent uploads share the one read-write connection
+_write_lock = threading.Lock()
+
+# get_table_metadata results by (upload generation, lowercased table name); entries for older
+# uploads are dropped when /upload-csv publishes a new one
+_metadata_cache: Dict[Tuple[int, str], Dict[str, Any]] = {}
+
+# Upper bound on rows returned by one query (generated SQL doesn't always include a LIMIT)
+MAX_RESULT_ROWS = 10000
+FETCH_BATCH_SIZE = 500
+STREAM_BATCH_SIZE = 100  # rows per "rows" event on /query/stream
+
+# Semantic /query response cache settings
+EMBEDDING_MODEL = "models/text-embedding-004"
+SEMANTIC_CACHE_THRESHOLD = 0.92  # minimum cosine similarity for two questions to share a response
+SEMANTIC_CACHE_SIZE = 500
+SEMANTIC_CACHE_MAX_ROWS = 50000  # total result rows held across all cached responses
+SEMANTIC_CACHE_MAX_ENTRY_ROWS = 1000  # larger results are not cached at all
+
+# Generated SQL keyed by (table, schema hash, normalized question), kept for 10 minutes
+sql_query_cache = TTLCache(maxsize=256, ttl=600)
+
+# Sample questions keyed by UploadState.schema_fp, so uploads with identical columns and
+# dtypes share one Gemini sample-question call for 24 hours
+sample_questions_cache = TTLCache(maxsize=256, ttl=86400)
+
 # Gemini Client Class
 class GeminiClient:
     def __init__(self, model="gemini-2.5-flash", api_key=None):
@@ -99,15 +195,20 @@ class GeminiClient:
         self.api_key = api_key or DEFAULT_API_KEY
         self.temperature = 0.0
         self.top_p = 0.9
+        # (time.monotonic() of the last check, result); -inf means "never checked", since the clock starts at boot
+        self._last_health_check = (float("-inf"), False)
         self._configure_client()
     
     def _configure_client(self):
         """Configure the Gemini client with API key"""
         try:
             if self.api_key and self.api_key != "YOUR_DEFAULT_API_KEY_HERE":
-                genai.configure(api_key=None)
-                genai.configure(api_key=self.api_key)
+                # Each client talks to Gemini through its own API-key-scoped service clients;
+                # genai.configure would change the key for every client in the process
+                self.client_options = {"api_key": self.api_key}
                 self.client = genai.GenerativeModel(self.model)
+                self.client._client = glm.GenerativeServiceClient(client_options=self.client_options)
+                self._async_client = None
                 logger.info(f"Gemini client configured with model: {self.model}")
             else:
                 logger.warning("No valid API key provided")
@@ -117,7 +218,17 @@ class GeminiClient:
             self.client = None
     
     def test_connection(self):
-        """Test if Gemini API is accessible"""
+        """Test if Gemini API is accessible (result cached for HEALTH_CHECK_TTL seconds)"""
+        checked_at, healthy = self._last_health_check
+        if time.monotonic() - checked_at < HEALTH_CHECK_TTL:
+            return healthy
+        
+        healthy = self._probe_connection()
+        self._last_health_check = (time.monotonic(), healthy)
+        return healthy
+    
+    def _probe_connection(self):
+        """Send a tiny prompt to Gemini to check the API is reachable"""
         try:
             if not self.client:
                 return False
@@ -147,15 +258,23 @@ class GeminiClient:
             logger.warning(f"Gemini connection test failed: {e}")
             return False
     
+    def get_async_client(self):
+        """Return this client's key-scoped async service client, bound to the model on first use"""
+        # Created lazily because grpc.aio channels belong to the event loop they are made in
+        if self._async_client is None:
+            self._async_client = glm.GenerativeServiceAsyncClient(client_options=self.client_options)
+            self.client._async_client = self._async_client
+        return self._async_client
+    
     def get_available_models(self):
         """Get list of available Gemini models"""
         try:
             if not self.api_key or self.api_key == "YOUR_DEFAULT_API_KEY_HERE":
                 return []
             
-            genai.configure(api_key=self.api_key)
             models = []
-            for model in genai.list_models():
+            model_client = glm.ModelServiceClient(client_options={"api_key": self.api_key})
+            for model in genai.list_models(client=model_client):
                 if 'generateContent' in model.supported_generation_methods:
                     models.append(model.name.replace('models/', ''))
             return models
@@ -166,10 +285,36 @@ class GeminiClient:
     def update_api_key(self, api_key: str):
         """Update the API key and reconfigure client"""
         self.api_key = api_key
+        self._last_health_check = (float("-inf"), False)
         self._configure_client()
     
-    def generate_response(self, prompt, system_prompt=None):
-        """Generate response using Gemini"""
+    async def generate_response(self, prompt, system_prompt=None, max_output_tokens=1000):
+        """Generate response using Gemini, queued through the shared Gemini worker"""
+        if gemini_queue is None:
+            return await self._generate_response(prompt, system_prompt, max_output_tokens)
+        
+        future = asyncio.get_running_loop().create_future()
+        await gemini_queue.put((self, prompt, system_prompt, max_output_tokens, future))
+        return await future
+    
+    def _request_options(self, max_output_tokens):
+        """Generation config and safety settings shared by all generate_content calls"""
+        generation_config = genai.types.GenerationConfig(
+            temperature=self.temperature,
+            top_p=self.top_p,
+            max_output_tokens=max_output_tokens,
+        )
+
+        safety_settings = {
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+        }
+        return generation_config, safety_settings
+    
+    async def _generate_response(self, prompt, system_prompt=None, max_output_tokens=1000):
+        """Send a single generate_content request to Gemini"""
         try:
             if not self.client:
                 logger.error("Gemini client not configured properly")
@@ -181,28 +326,20 @@ class GeminiClient:
             
             logger.info(f"Sending request to Gemini API with model: {self.model}")
             
-            generation_config = genai.types.GenerationConfig(
-                temperature=self.temperature,
-                top_p=self.top_p,
-                max_output_tokens=1000,
-            )
-
-            safety_settings = {
-            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-            }
+            generation_config, safety_settings = self._request_options(max_output_tokens)
+            self.get_async_client()
             
-            response = self.client.generate_content(
-                full_prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
+            async with gemini_slots:
+                response = await self.client.generate_content_async(
+                    full_prompt,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings
+                )
             
             if response.text:
                 result = response.text.strip()
                 logger.info(f"Gemini response received: {result[:100]}...")
+                self._last_health_check = (time.monotonic(), True)
                 return result
             else:
                 logger.error("Gemini returned empty response")
@@ -210,80 +347,181 @@ class GeminiClient:
                 
         except Exception as e:
             logger.error(f"Gemini API error: {str(e)}")
+            self._last_health_check = (float("-inf"), False)
+            return None
+    
+    async def generate_response_stream(self, prompt, system_prompt=None, max_output_tokens=1000):
+        """Yield response text from Gemini chunk by chunk as it is generated"""
+        if not self.client:
+            logger.error("Gemini client not configured properly")
+            return
+        
+        full_prompt = prompt
+        if system_prompt:
+            full_prompt = f"{system_prompt}\n\n{prompt}"
+        
+        logger.info(f"Streaming request to Gemini API with model: {self.model}")
+        
+        generation_config, safety_settings = self._request_options(max_output_tokens)
+        
+        try:
+            self.get_async_client()
+            # Streams bypass the queue, so they take a slot directly; it is held until the stream ends
+            async with gemini_slots:
+                response = await self.client.generate_content_async(
+                    full_prompt,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                    stream=True
+                )
+                async for chunk in response:
+                    if chunk.text:
+                        yield chunk.text
+            self._last_health_check = (time.monotonic(), True)
+        except Exception as e:
+            logger.error(f"Gemini streaming error: {str(e)}")
+            self._last_health_check = (float("-inf"), False)
+    
+    async def embed_text(self, text):
+        """Return the unit-normalized Gemini embedding of text, or None if embedding fails"""
+        if not self.client:
+            return None
+        
+        try:
+            async with gemini_slots:
+                result = await genai.embed_content_async(
+                    model=EMBEDDING_MODEL, content=text, client=self.get_async_client()
+                )
+            embedding = np.asarray(result['embedding'], dtype=np.float32)
+            return embedding / np.linalg.norm(embedding)
+        except Exception as e:
+            logger.warning(f"Gemini embedding failed: {str(e)}")
             return None
 
 # Initialize Gemini client
 gemini_client = GeminiClient(model="gemini-2.5-flash")
 
-def generate_ai_summary(user_question, query_results, sql_query, api_key=None):
-    """Generate AI-powered analytical summary of query results"""
+# Gemini requests are funnelled through a queue drained by GEMINI_CONCURRENCY worker tasks
+# (started on app startup) so concurrent handlers can't flood the API
+GEMINI_CONCURRENCY = int(os.getenv("QUERYBOT_GEMINI_CONCURRENCY", "4"))
+# Taken around every Gemini API call, queued or streamed, so at most GEMINI_CONCURRENCY are in flight
+gemini_slots = asyncio.Semaphore(GEMINI_CONCURRENCY)
+gemini_queue: Optional[asyncio.Queue] = None
+gemini_worker_tasks: List[asyncio.Task] = []
+
+async def run_gemini_job(job):
+    """Run one queued Gemini request and hand the result to the waiting handler"""
+    client, prompt, system_prompt, max_output_tokens, future = job
+    # The waiting handler was cancelled while the job sat in the queue; don't spend a call on it
+    if future.done():
+        return
+    try:
+        result = await client._generate_response(prompt, system_prompt, max_output_tokens)
+        if not future.done():
+            future.set_result(result)
+    except Exception as e:
+        if not future.done():
+            future.set_exception(e)
+
+async def gemini_worker(q):
+    """Take Gemini requests off the queue one at a time, so a slow call only holds its own slot"""
+    while True:
+        job = await q.get()
+        try:
+            await run_gemini_job(job)
+        finally:
+            q.task_done()
+
+# Clients keyed by API key so per-request keys don't rebuild the model every call
+_client_pool: Dict[str, GeminiClient] = {}
+
+def get_client(api_key=None):
+    """Return the pooled GeminiClient for api_key, creating it on first use"""
+    if not api_key or api_key == DEFAULT_API_KEY:
+        return gemini_client
     
-    client_to_use = gemini_client
-    if api_key:
-        client_to_use = GeminiClient(api_key=api_key)
+    client = _client_pool.get(api_key)
+    if client is None:
+        client = GeminiClient(api_key=api_key)
+        _client_pool[api_key] = client
+    return client
+
+# Numbers, quoted strings and capitalized words after the first: the parts of a question that
+# usually become SQL filters, limits or literals
+_QUESTION_LITERAL = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:\.\d+)?|(?<=\s)[A-Z][\w-]*")
+
+def question_literals(question):
+    """Return the SQL-relevant literals in a question, which must match exactly for a semantic cache hit"""
+    return "|".join(sorted({literal.strip('\'"').lower() for literal in _QUESTION_LITERAL.findall(question)}))
+
+class SemanticQueryCache:
+    """LRU cache of /query responses looked up by cosine similarity of question embeddings.
+    Entries only match questions on the same table with the same question_literals, so
+    "top 5" never answers "top 10" however similar the embeddings are"""
     
-    if not client_to_use.test_connection():
-        logger.info("Gemini not available for summary generation")
-        return None
+    def __init__(self, max_size=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_rows=SEMANTIC_CACHE_MAX_ROWS, max_entry_rows=SEMANTIC_CACHE_MAX_ENTRY_ROWS):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.max_rows = max_rows
+        self.max_entry_rows = max_entry_rows
+        self.clear()
     
-    try:
-        # Prepare data sample for analysis (limit to avoid token limits)
-        data_sample = query_results[:10] if len(query_results) > 10 else query_results
+    def clear(self):
+        """Drop every entry; called when an upload replaces the data"""
+        self.embeddings = None  # (n, dim) matrix of unit vectors, oldest first
+        self.scopes = np.empty(0, dtype=object)  # "table\x1fliterals" per entry
+        self.responses: List[QueryResponse] = []
+        self.total_rows = 0
+    
+    def _reorder(self, order):
+        self.embeddings = self.embeddings[order]
+        self.scopes = self.scopes[order]
+        self.responses = [self.responses[i] for i in order]
+    
+    @staticmethod
+    def _scope(table_name, question):
+        return f"{table_name.lower()}\x1f{question_literals(question)}"
+    
+    def lookup(self, embedding, table_name, question):
+        """Return the cached response for the most similar matching question on table_name, if close enough"""
+        if not self.responses:
+            return None
+        
+        scores = np.where(self.scopes == self._scope(table_name, question), self.embeddings @ embedding, -1.0)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
         
-        # Extract key insights from the data
-        total_records = len(query_results)
-        columns = list(query_results[0].keys()) if query_results else []
+        logger.info(f"Semantic cache hit (similarity {scores[best]:.3f})")
+        response = self.responses[best]
+        self._reorder(np.r_[np.delete(np.arange(len(self.responses)), best), best])
+        return response
+    
+    def add(self, embedding, table_name, response):
+        """Store a response, evicting least recently used entries past the size or row budget"""
+        if len(response.data) > self.max_entry_rows:
+            return
+        
+        if self.embeddings is None:
+            self.embeddings = embedding[np.newaxis, :]
+        else:
+            self.embeddings = np.vstack([self.embeddings, embedding])
+        self.scopes = np.append(self.scopes, self._scope(table_name, response.question))
+        self.responses.append(response)
+        self.total_rows += len(response.data)
         
-        # Identify numeric columns and calculate basic stats
-        numeric_insights = []
-        categorical_insights = []
+        evict = 0
+        while len(self.responses) - evict > self.max_size or self.total_rows > self.max_rows:
+            self.total_rows -= len(self.responses[evict].data)
+            evict += 1
+        if evict:
+            self._reorder(np.arange(evict, len(self.responses)))
 
-        insights = {
-        'total_records': total_records,
-        'key_metrics': {},
-        'patterns': []
-        }
+query_response_cache = SemanticQueryCache()
 
-        for col in columns:
-           values = [row.get(col) for row in query_results if row.get(col) is not None]
-           try:
-               numeric_values = [float(v) for v in values if str(v).replace('.', '').replace('-', '').replace(',', '').isdigit()]
-               if len(numeric_values) > 0:
-                    insights['key_metrics'][col] = {
-                'min': min(numeric_values),
-                'max': max(numeric_values),
-                'avg': round(sum(numeric_values) / len(numeric_values), 2)
-               }
-           except:
-                continue
-
-        if query_results:
-            for col in columns:
-                values = [row.get(col) for row in query_results if row.get(col) is not None]
-                
-                # Check if column is numeric
-                try:
-                    numeric_values = [float(v) for v in values if str(v).replace('.', '').replace('-', '').isdigit()]
-                    if len(numeric_values) > 0:
-                        numeric_insights.append({
-                            'column': col,
-                            'min': min(numeric_values),
-                            'max': max(numeric_values),
-                            'avg': sum(numeric_values) / len(numeric_values),
-                            'count': len(numeric_values)
-                        })
-                except:
-                    # Handle categorical data
-                    if len(values) > 0:
-                        unique_values = list(set([str(v) for v in values]))
-                        if len(unique_values) <= 10:  # Only for manageable categories
-                            categorical_insights.append({
-                                'column': col,
-                                'unique_count': len(unique_values),
-                                'top_values': unique_values[:5]
-                            })
-        
-        system_prompt = """You are an expert data analyst. Generate a concise, insightful summary of query results.
+# Static instructions go in the system prompt so every call shares the same leading tokens
+SUMMARY_SYSTEM_PROMPT = """You are an expert data analyst. Generate a concise, insightful summary of query results.
 ANALYSIS APPROACH:
 - Focus on actionable business insights, not just data description
 - Identify trends, patterns, and outliers that matter
@@ -296,77 +534,147 @@ RESPONSE FORMAT:
 - Use specific numbers and percentages
 - End with business relevance or implication
 
-TONE: Professional, confident, insight-driven (not just descriptive)"""
-        
-        query_intent = "general"
-        if any(word in user_question.lower() for word in ['top', 'highest', 'best', 'maximum']):
-           query_intent = "ranking"
-        elif any(word in user_question.lower() for word in ['total', 'sum', 'count', 'how many']):
-           query_intent = "aggregation"
-        elif any(word in user_question.lower() for word in ['average', 'mean']):
-           query_intent = "central_tendency"
-        elif any(word in user_question.lower() for word in ['compare', 'vs', 'difference']):
-           query_intent = "comparison"
+TONE: Professional, confident, insight-driven (not just descriptive)
+
+ANALYSIS REQUIREMENTS:
+- What does this data reveal about the business situation?
+- What are the key takeaways for decision-making?
+- Are there any notable patterns or outliers?"""
+
+def build_summary_prompt(user_question, query_results):
+    """Build the (prompt, system_prompt) pair for summarizing query results"""
+    # Extract key insights from the data
+    total_records = len(query_results)
+    columns = list(query_results[0].keys()) if query_results else []
+    
+    insights = {
+    'total_records': total_records,
+    'key_metrics': {},
+    'patterns': []
+    }
+
+    # Build the result frame once and compute min/max/mean for every numeric-looking column
+    results_df = pd.DataFrame(query_results, columns=columns).select_dtypes(exclude='bool')
+    numeric_df = results_df.apply(pd.to_numeric, errors='coerce')
+    numeric_df = numeric_df.loc[:, numeric_df.notna().any()]
+    if not numeric_df.empty:
+        stats = numeric_df.agg(['min', 'max', 'mean'])
+        for col in stats.columns:
+            insights['key_metrics'][col] = {
+                'min': float(stats.at['min', col]),
+                'max': float(stats.at['max', col]),
+                'avg': round(float(stats.at['mean', col]), 2)
+            }
 
-        prompt = f"""BUSINESS QUERY ANALYSIS:
+    query_intent = "general"
+    if any(word in user_question.lower() for word in ['top', 'highest', 'best', 'maximum']):
+       query_intent = "ranking"
+    elif any(word in user_question.lower() for word in ['total', 'sum', 'count', 'how many']):
+       query_intent = "aggregation"
+    elif any(word in user_question.lower() for word in ['average', 'mean']):
+       query_intent = "central_tendency"
+    elif any(word in user_question.lower() for word in ['compare', 'vs', 'difference']):
+       query_intent = "comparison"
+
+    prompt = f"""BUSINESS QUERY ANALYSIS:
 
 Query Intent: {query_intent}
 User Question: "{user_question}"
-Results Found: {total_records} records
-
-KEY METRICS: {insights['key_metrics']}
-REPRESENTATIVE DATA: {data_sample}
 
-ANALYSIS REQUIREMENTS:
-- What does this data reveal about the business situation?
-- What are the key takeaways for decision-making?
-- Are there any notable patterns or outliers?
+Schema: {columns}
+Aggregates: {insights['key_metrics']}
+RowCount: {total_records}
 
 Generate executive summary:"""
 
-        summary = client_to_use.generate_response(prompt, system_prompt)
+    return prompt, SUMMARY_SYSTEM_PROMPT
+
+def clean_summary(summary):
+    """Strip boilerplate prefixes Gemini sometimes puts in front of a summary"""
+    summary = summary.strip()
+    prefixes_to_remove = ['summary:', 'analysis:', 'insight:', 'key finding:', 'result:']
+    for prefix in prefixes_to_remove:
+        if summary.lower().startswith(prefix):
+            summary = summary[len(prefix):].strip()
+    return summary
+
+async def clean_summary_stream(chunks, head_size=32):
+    """clean_summary for streamed text: hold back the first head_size characters to strip prefixes"""
+    head = ""
+    async for chunk in chunks:
+        if head is None:
+            yield chunk
+            continue
+        head += chunk
+        if len(head.lstrip()) >= head_size:
+            # Keep trailing whitespace, the next chunk continues the sentence
+            yield clean_summary(head) + head[len(head.rstrip()):]
+            head = None
+    if head and clean_summary(head):
+        yield clean_summary(head)
+
+async def generate_ai_summary(user_question, query_results, sql_query, api_key=None):
+    """Generate AI-powered analytical summary of query results"""
+    
+    client_to_use = get_client(api_key)
+    
+    if not client_to_use.client:
+        logger.info("Gemini not available for summary generation")
+        return None
+    
+    try:
+        # Building the prompt aggregates the full result set in pandas, so keep it off the event loop
+        prompt, system_prompt = await run_in_threadpool(build_summary_prompt, user_question, query_results)
+        summary = await client_to_use.generate_response(prompt, system_prompt)
         
         if summary:
-    # Clean and optimize summary
-          summary = summary.strip()
-    # Remove common prefixes
-          prefixes_to_remove = ['summary:', 'analysis:', 'insight:', 'key finding:', 'result:']
-          for prefix in prefixes_to_remove:
-              if summary.lower().startswith(prefix):
-                  summary = summary[len(prefix):].strip()
-    
-          logger.info("Generated enhanced AI summary successfully")
-          return summary
-        
-    except Exception as e:  # <-- ADD THIS
+            logger.info("Generated enhanced AI summary successfully")
+            return clean_summary(summary)
+        
+    except Exception as e:
         logger.error(f"Error generating AI summary: {str(e)}")
         return None
 
 
+DATA_CONTEXTS = {
+    'supply_chain': ['supplier', 'order', 'quantity', 'shipment', 'delivery', 'inventory', 'procurement', 'vendor'],
+    'employee': ['employee', 'salary', 'department', 'position', 'hire', 'manager', 'staff', 'hr'],
+    'sales': ['sales', 'revenue', 'customer', 'product', 'price', 'purchase', 'transaction', 'order'],
+    'finance': ['amount', 'balance', 'account', 'payment', 'expense', 'income', 'budget', 'cost'],
+    'inventory': ['stock', 'warehouse', 'item', 'sku', 'inventory', 'quantity', 'location'],
+    'customer': ['customer', 'client', 'contact', 'phone', 'email', 'address', 'demographics'],
+    'project': ['project', 'task', 'milestone', 'deadline', 'status', 'team', 'progress'],
+    'marketing': ['campaign', 'lead', 'conversion', 'roi', 'engagement', 'impression', 'click']
+}
+
+# Contexts each keyword counts towards (e.g. 'order' scores for supply_chain and sales)
+KEYWORD_CONTEXTS = {
+    keyword: [context for context, keywords in DATA_CONTEXTS.items() if keyword in keywords]
+    for keyword in sorted({kw for keywords in DATA_CONTEXTS.values() for kw in keywords})
+}
+
+# All keywords in one alternation, wrapped in a lookahead so overlapping hits are all found
+# in a single scan over the column names
+KEYWORD_PATTERN = re.compile(
+    '(?=(' + '|'.join(re.escape(kw) for kw in sorted(KEYWORD_CONTEXTS, key=len, reverse=True)) + '))'
+)
+
 def detect_data_type_and_context(df):
     """Analyze the dataframe to detect what type of data it is"""
     columns = [col.lower() for col in df.columns]
     column_names = df.columns.tolist()
     
-    data_contexts = {
-        'supply_chain': ['supplier', 'order', 'quantity', 'shipment', 'delivery', 'inventory', 'procurement', 'vendor'],
-        'employee': ['employee', 'salary', 'department', 'position', 'hire', 'manager', 'staff', 'hr'],
-        'sales': ['sales', 'revenue', 'customer', 'product', 'price', 'purchase', 'transaction', 'order'],
-        'finance': ['amount', 'balance', 'account', 'payment', 'expense', 'income', 'budget', 'cost'],
-        'inventory': ['stock', 'warehouse', 'item', 'sku', 'inventory', 'quantity', 'location'],
-        'customer': ['customer', 'client', 'contact', 'phone', 'email', 'address', 'demographics'],
-        'project': ['project', 'task', 'milestone', 'deadline', 'status', 'team', 'progress'],
-        'marketing': ['campaign', 'lead', 'conversion', 'roi', 'engagement', 'impression', 'click']
-    }
+    # Newline-joined so a keyword can never match across two column names
+    joined_columns = '\n'.join(columns)
     
     context_scores = {}
-    for context, keywords in data_contexts.items():
-        score = sum(1 for keyword in keywords if any(keyword in col for col in columns))
-        if score > 0:
-            context_scores[context] = score
+    for keyword in set(KEYWORD_PATTERN.findall(joined_columns)):
+        for context in KEYWORD_CONTEXTS[keyword]:
+            context_scores[context] = context_scores.get(context, 0) + 1
     
     if context_scores:
-        detected_context = max(context_scores, key=context_scores.get)
+        # Break ties in DATA_CONTEXTS order; findall/set order varies with the string hash seed
+        detected_context = max(DATA_CONTEXTS, key=lambda context: context_scores.get(context, 0))
         confidence = context_scores[detected_context] / len(columns)
     else:
         detected_context = 'general'
@@ -374,28 +682,33 @@ def detect_data_type_and_context(df):
     
     return detected_context, confidence, column_names
 
-def generate_contextual_sample_questions(df, data_context, api_key=None):
-    """Generate sample questions based on the actual data structure and context"""
+def schema_fingerprint(df):
+    """Hash the column names and dtypes of a dataframe"""
+    schema = ','.join(f'{col}:{dtype}' for col, dtype in zip(df.columns, df.dtypes))
+    return hashlib.blake2b(schema.encode(), digest_size=16).hexdigest()
+
+# Numbering and bullet prefixes Gemini sometimes puts in front of generated questions
+_NUM_PREFIX = re.compile(r'^\d+[\.\)]\s*')
+_BULLET_PREFIX = re.compile(r'^[-*]\s*')
+
+async def generate_contextual_sample_questions(df, data_context, api_key=None, profile=None):
+    """Generate sample questions based on the actual data structure and context, as (questions, from_gemini)"""
     
     columns = df.columns.tolist()
-    sample_data = df.head(3).to_dict('records')
     
-    client_to_use = gemini_client
-    if api_key:
-        client_to_use = GeminiClient(api_key=api_key)
+    client_to_use = get_client(api_key)
     
-    if client_to_use.test_connection():
+    if client_to_use.client:
         logger.info("Using Gemini to generate contextual sample questions")
         
-        clean_sample = []
-        for row in sample_data[:2]:
-            clean_row = {}
-            for k, v in row.items():
-                if pd.isna(v):
-                    clean_row[k] = "N/A"
-                else:
-                    clean_row[k] = str(v)[:50]
-            clean_sample.append(clean_row)
+        # First two rows as strings truncated to 50 chars, missing values shown as N/A
+        sample = df.head(2)
+        clean_sample = (
+            sample.astype(str)
+            .apply(lambda col: col.str[:50])
+            .where(sample.notna(), "N/A")
+            .to_dict('records')
+        )
 
         system_prompt = """You are an expert data analyst. Generate 4 relevant sample questions that should relate to the dataset provided and that users would typically ask about their dataset.
 QUESTION REQUIREMENTS:
@@ -428,15 +741,15 @@ Focus on insights that would be valuable for business decision-making.
 Generate questions now:"""
 
         try:
-            response = client_to_use.generate_response(prompt, system_prompt)
+            response = await client_to_use.generate_response(prompt, system_prompt)
             
             if response:
                 questions = []
                 lines = response.strip().split('\n')
                 for line in lines:
                     clean_line = line.strip()
-                    clean_line = re.sub(r'^\d+[\.\)]\s*', '', clean_line)
-                    clean_line = re.sub(r'^[-*]\s*', '', clean_line)
+                    clean_line = _NUM_PREFIX.sub('', clean_line)
+                    clean_line = _BULLET_PREFIX.sub('', clean_line)
                     clean_line = clean_line.strip('"\'')
                     
                     if clean_line and len(clean_line) > 10:
@@ -444,24 +757,42 @@ Generate questions now:"""
                 
                 if len(questions) >= 3:
                     logger.info(f"Generated {len(questions)} contextual questions via Gemini")
-                    return questions[:4]
+                    return questions[:4], True
             
         except Exception as e:
             logger.error(f"Error generating questions with Gemini: {str(e)}")
     
     logger.info("Using pattern-based question generation")
-    return generate_pattern_based_questions(df, data_context, columns)
+    questions = await run_in_threadpool(generate_pattern_based_questions, df, data_context, columns, profile)
+    return questions, False
+
+def build_dataset_profile(df):
+    """Scan the dataframe once for the column statistics the endpoints need"""
+    object_cols = df.columns[df.dtypes == 'object']
+    nunique = df[object_cols].nunique()
+    categorical_cols = nunique[nunique < len(df) * 0.5].index.tolist()
+    
+    value_counts = {}
+    for col in categorical_cols:
+        counts = df[col].value_counts().head(10)
+        value_counts[col] = dict(zip(counts.index.astype(str), counts.astype(int).tolist()))
+    
+    return DatasetProfile(
+        numeric_cols=df.select_dtypes(include=['number']).columns.tolist(),
+        categorical_cols=categorical_cols,
+        dtypes_str=df.dtypes.astype(str).to_dict(),
+        missing_counts={col: int(n) for col, n in df.isnull().sum().items()},
+        value_counts_top10_by_col=value_counts,
+        sample_records=df.head(3).fillna("N/A").to_dict('records')
+    )
 
-def generate_pattern_based_questions(df, data_context, columns):
+def generate_pattern_based_questions(df, data_context, columns, profile=None):
     """Generate questions based on data patterns when Gemini is unavailable"""
     questions = []
     
-    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-    
-    categorical_cols = []
-    for col in df.columns:
-        if df[col].dtype == 'object' and df[col].nunique() < len(df) * 0.5:
-            categorical_cols.append(col)
+    profile = profile or build_dataset_profile(df)
+    numeric_cols = profile.numeric_cols
+    categorical_cols = profile.categorical_cols
     
     if data_context == 'employee':
         if any('salary' in col.lower() for col in numeric_cols):
@@ -516,19 +847,172 @@ def generate_pattern_based_questions(df, data_context, columns):
     
     return questions[:6]
 
+def apply_sqlite_pragmas(conn):
+    """Tune a connection for the read-heavy query workload"""
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")  # 64 MB page cache
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MB memory-mapped I/O
+
+def get_write_connection():
+    """Return the read-write connection, opening the database in WAL mode on first use"""
+    global current_connection
+    if current_connection is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        apply_sqlite_pragmas(conn)
+        current_connection = conn
+    return current_connection
+
+def ensure_read_pool():
+    """Open the read-only connections once the database file exists"""
+    global _read_pool_ready
+    with _read_pool_lock:
+        if _read_pool_ready:
+            return
+        
+        uri = f"{Path(DB_PATH).resolve().as_uri()}?mode=ro"
+        for _ in range(READ_POOL_SIZE):
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            apply_sqlite_pragmas(conn)
+            read_pool.put(conn)
+        _read_pool_ready = True
+        logger.info(f"Opened {READ_POOL_SIZE} read-only SQLite connections on {DB_PATH}")
+
+@contextmanager
+def read_connection():
+    """Borrow a read-only connection from the pool for the duration of one request"""
+    conn = read_pool.get()
+    try:
+        yield conn
+    finally:
+        read_pool.put(conn)
+
+# pd.read_csv's default NA markers; Arrow's defaults leave out "None" and "<NA>"
+PANDAS_NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+def pandas_column_names(names):
+    """Name blank headers "Unnamed: N" and suffix duplicates with .1, .2, ... as pd.read_csv does"""
+    names = [name if name != "" else f"Unnamed: {i}" for i, name in enumerate(names)]
+    counts = {}
+    result = []
+    for col in names:
+        base = col
+        cur_count = counts.get(col, 0)
+        while cur_count > 0:
+            counts[base] = cur_count + 1
+            col = f"{base}.{cur_count}"
+            # Skip suffixes that are already taken by another header
+            cur_count = cur_count + 1 if col in names else counts.get(col, 0)
+        result.append(col)
+        counts[col] = cur_count + 1
+    return result
+
+def read_csv_arrow(source, start, column_types=None):
+    """Read the CSV at source (from offset start) into an Arrow table with pandas' NA markers"""
+    source.seek(start)
+    return pacsv.read_csv(
+        source,
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            null_values=PANDAS_NA_VALUES,
+            strings_can_be_null=True
+        )
+    )
+
+def parse_csv(source):
+    """Parse an uploaded CSV (file object or bytes) into a dataframe"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    start = source.tell()
+    
+    # PyArrow reads the source in blocks and parses them on all cores, with no decoded str copy
+    try:
+        table = read_csv_arrow(source, start)
+        # Arrow turns non-UTF-8 text into binary columns; pandas raises on it instead
+        if any(pa.types.is_binary(field.type) for field in table.schema):
+            raise pa.ArrowInvalid("CSV contains text that is not valid UTF-8")
+        # Re-read inferred dates and timestamps as text, so values are stored as the user wrote them
+        temporal = {field.name: pa.string() for field in table.schema if pa.types.is_temporal(field.type)}
+        if temporal:
+            table = read_csv_arrow(source, start, temporal)
+    except pa.ArrowInvalid as e:
+        # Arrow rejects files pandas tolerates, e.g. rows with fewer fields than the header
+        logger.info(f"PyArrow could not parse CSV ({e}), falling back to pandas")
+        source.seek(start)
+        return pd.read_csv(source)
+    
+    table = table.rename_columns(pandas_column_names(table.column_names))
+    # All-empty columns are float NaN in pandas, not object None; header-only files are all object
+    empty_type = pa.float64() if table.num_rows else pa.string()
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(empty_type))
+    # Nulls come back as None in object columns and NaN in numeric ones; sqlite3 binds both as NULL
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    return df
+
+def quote_identifier(name):
+    """Quote a table or column name for use in SQLite statements"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def sqlite_column_type(dtype):
+    """Map a pandas dtype to the SQLite column type df.to_sql would have used"""
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
 def load_csv_to_sqlite(df, table_name="supply_chain_data"):
     """Convert CSV to SQLite table"""
     try:
-        conn = sqlite3.connect(':memory:')
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
+        table_sql = quote_identifier(table_name)
+        columns_sql = ", ".join(f"{quote_identifier(col)} {sqlite_column_type(dtype)}" for col, dtype in df.dtypes.items())
+        placeholders = ", ".join("?" * len(df.columns))
+        
+        with _write_lock:
+            conn = get_write_connection()
+            # Skip fsyncs during the bulk load and replace the table in a single transaction
+            conn.execute("PRAGMA synchronous=OFF")
+            try:
+                conn.execute("BEGIN")
+                conn.execute(f"DROP TABLE IF EXISTS {table_sql}")
+                conn.execute(f"CREATE TABLE {table_sql} ({columns_sql})")
+                conn.executemany(
+                    f"INSERT INTO {table_sql} VALUES ({placeholders})",
+                    df.itertuples(index=False, name=None)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("PRAGMA synchronous=NORMAL")
+        
+        ensure_read_pool()
         logger.info(f"Data loaded to SQLite table '{table_name}' with {len(df)} rows")
         return conn, table_name
     except Exception as e:
         logger.error(f"Error loading data to SQLite: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error loading data to SQLite: {str(e)}")
 
-def get_table_metadata(conn, table_name):
-    """Get table structure for metadata"""
+def get_table_metadata_pooled(upload, table_name):
+    """get_table_metadata on a pooled read-only connection"""
+    with read_connection() as conn:
+        return get_table_metadata(conn, upload, table_name)
+
+def get_table_metadata(conn, upload, table_name):
+    """Get table structure for metadata, memoized for the upload it was read for"""
+    cache_key = (upload.generation, table_name.lower())
+    cached = _metadata_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
         cursor = conn.cursor()
         cursor.execute(f"PRAGMA table_info({table_name})")
@@ -541,35 +1025,73 @@ def get_table_metadata(conn, table_name):
             'columns': [col[1] for col in columns_info],
             'column_types': [(col[1], col[2]) for col in columns_info],
             'sample_data': sample_data,
-            'total_rows': len(current_dataframe) if current_dataframe is not None else 0
+            'total_rows': len(upload.dataframe)
         }
         
         logger.info(f"Table metadata retrieved: {len(metadata['columns'])} columns, {metadata['total_rows']} rows")
+        _metadata_cache[cache_key] = metadata
         return metadata
     except Exception as e:
         logger.error(f"Error getting metadata: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error getting metadata: {str(e)}")
 
 
-def generate_sql_query_gemini(user_question, metadata, table_name, api_key=None):
-    """Generate SQL query using Gemini"""
+# Quoted strings and identifiers are blanked out before checking generated SQL for keywords
+_SQL_QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]")
+_SQL_READ_START = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+_SQL_FORBIDDEN = re.compile(
+    r'\b(attach|detach|pragma|insert|update|delete|drop|alter|create|vacuum|reindex|load_extension)\b',
+    re.IGNORECASE
+)
+
+def is_read_only_select(sql_query):
+    """Check that generated SQL is a single SELECT that cannot modify or attach databases"""
+    if not sql_query:
+        return False
+    unquoted = _SQL_QUOTED.sub("''", sql_query)
+    return (
+        ';' not in unquoted
+        and bool(_SQL_READ_START.match(unquoted))
+        and not _SQL_FORBIDDEN.search(unquoted)
+    )
+
+def normalize_question(question):
+    """Normalize a question so trivially different phrasings share a cache entry"""
+    question = re.sub(r'\s+', ' ', question.strip().lower())
+    return question.rstrip('?.! ')
+
+def sql_cache_key(user_question, metadata, table_name):
+    """Build the generated-SQL cache key; the schema hash invalidates entries when columns change"""
+    columns_hash = hash(tuple(metadata['column_types']))
+    return (table_name.lower(), columns_hash, normalize_question(user_question))
+
+SQL_SYSTEM_PROMPT = """You are a SQL expert. Generate a SQLite query.
+
+Rules:
+- Return ONLY the SQL query, no explanations
+- Use backticks for column names with spaces
+- Limit large result sets to 100 rows unless asking for totals"""
+
+async def generate_sql_query_gemini(user_question, metadata, table_name, api_key=None, use_cache=True):
+    """Generate SQL query using Gemini, reusing cached SQL for repeated questions"""
+    
+    cache_key = sql_cache_key(user_question, metadata, table_name)
+    if use_cache:
+        cached_sql = sql_query_cache.get(cache_key)
+        if cached_sql:
+            logger.info(f"SQL cache hit for question: {user_question}")
+            return cached_sql
+        logger.info(f"SQL cache miss for question: {user_question}")
     
     try:
-        # Configure with API key directly (like the working test)
-        api_to_use = api_key or DEFAULT_API_KEY
-        genai.configure(api_key=api_to_use)
-        
-        # Create model directly (like the working test)
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        client_to_use = get_client(api_key)
         
         columns_str = ", ".join([f"{col[0]} ({col[1]})" for col in metadata['column_types']])
         sample_str = str(metadata['sample_data'][:2]) if metadata['sample_data'] else "No sample data"
         numeric_cols = [col[0] for col in metadata['column_types'] if col[1].lower() in ['integer', 'real', 'numeric']]
         text_cols = [col[0] for col in metadata['column_types'] if col[1].lower() in ['text', 'varchar']]
         
-        prompt = f"""You are a SQL expert. Generate a SQLite query.
-
-Table: {table_name}
+        prompt = f"""Table: {table_name}
 Columns: {columns_str}
 Sample data: {sample_str}
 Total rows: {metadata['total_rows']}
@@ -579,33 +1101,18 @@ Text columns: {text_cols}
 
 User request: {user_question}
 
-Rules:
-- Return ONLY the SQL query, no explanations
-- Use backticks for column names with spaces
-- Limit large result sets to 100 rows unless asking for totals
-
 SQL Query:"""
 
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0,
-                max_output_tokens=200
-            ),
-            safety_settings={
-                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-            }
-        )
+        response = await client_to_use.generate_response(prompt, SQL_SYSTEM_PROMPT, max_output_tokens=200)
         
-        if response.text:
-            sql_query = response.text.strip()
+        if response:
+            sql_query = response
             # Clean markdown code blocks
             sql_query = sql_query.replace('```sqlite', '').replace('```sql', '').replace('```', '').strip()
             sql_query = sql_query.rstrip(';')
             logger.info(f"Generated SQL query via Gemini: {sql_query}")
+            if use_cache and is_read_only_select(sql_query):
+                sql_query_cache[cache_key] = sql_query
             return sql_query
         else:
             logger.error("Gemini returned no text")
@@ -614,69 +1121,137 @@ SQL Query:"""
         logger.error(f"Error with Gemini SQL generation: {str(e)}")
     
 
+async def get_cached_metadata(upload, table_name):
+    """Return memoized table metadata, only going to the thread pool on a cache miss"""
+    metadata = _metadata_cache.get((upload.generation, table_name.lower()))
+    if metadata is None:
+        metadata = await run_in_threadpool(get_table_metadata_pooled, upload, table_name)
+    return metadata
+
+def execute_query_pooled(sql_query):
+    """execute_query on a pooled read-only connection"""
+    with read_connection() as conn:
+        return execute_query(conn, sql_query)
+
+def fetch_row_batches(cursor, columns, batch_size=FETCH_BATCH_SIZE):
+    """Yield result rows as lists of dicts, stopping after MAX_RESULT_ROWS rows"""
+    fetched = 0
+    while fetched < MAX_RESULT_ROWS:
+        rows = cursor.fetchmany(min(batch_size, MAX_RESULT_ROWS - fetched))
+        if not rows:
+            break
+        fetched += len(rows)
+        yield [dict(zip(columns, row)) for row in rows]
+
 def execute_query(conn, sql_query):
-    """Execute the SQL query"""
+    """Execute the SQL query, returning (data, columns, truncated)"""
     try:
         logger.info(f"Executing SQL query: {sql_query}")
         cursor = conn.cursor()
         cursor.execute(sql_query)
-        results = cursor.fetchall()
         columns = [description[0] for description in cursor.description]
         
-        if results:
-            data = []
-            for row in results:
-                data.append(dict(zip(columns, row)))
-            logger.info(f"Query executed successfully, returned {len(data)} rows")
-            return data, columns
-        else:
-            logger.info("Query executed successfully, returned 0 rows")
-            return [], columns
+        data = []
+        for rows in fetch_row_batches(cursor, columns):
+            data.extend(rows)
+        
+        # Only call it truncated if a row is actually left past the cap
+        truncated = len(data) >= MAX_RESULT_ROWS and cursor.fetchone() is not None
+        if truncated:
+            logger.warning(f"Query result truncated to {MAX_RESULT_ROWS} rows")
+        logger.info(f"Query executed successfully, returned {len(data)} rows")
+        return data, columns, truncated
     
     except Exception as e:
         logger.error(f"SQL execution error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"SQL execution error: {str(e)}")
 
+def result_message(data, truncated):
+    """Status message for a successful query, noting when rows were cut off"""
+    if truncated:
+        return f"Query executed successfully. Showing the first {len(data)} results; the rest were truncated."
+    return f"Query executed successfully. Found {len(data)} results."
+
+def format_sse(event, data):
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 # API Endpoints
 @app.get("/")
 async def root():
     return {"message": "supply_chain_data, API with Gemini", "status": "running"}
 
+@app.get("/gemini/status")
+async def gemini_status(api_key: Optional[str] = None):
+    """Report whether the Gemini API is reachable"""
+    client_to_use = get_client(api_key)
+    
+    return {
+        "available": await run_in_threadpool(client_to_use.test_connection),
+        "model": client_to_use.model
+    }
+
 @app.post("/upload-csv")
 async def upload_csv(file: UploadFile = File(...)):
     """Upload and process CSV file"""
-    global current_dataframe, current_connection
-    
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
+    async with _upload_lock:
+        return await ingest_upload(file)
+
+async def ingest_upload(file):
+    """Parse, load and profile an uploaded CSV, then publish it as the current upload"""
+    global current_upload, upload_generation
+    
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-        
-        df_clean = df.copy()
-        df_clean = df_clean.where(pd.notnull(df_clean), None)
+        # Parse straight from the spooled upload file instead of reading it into one bytes object
+        await file.seek(0)
+        df_clean = await run_in_threadpool(parse_csv, file.file)
+        schema_fp = schema_fingerprint(df_clean)
         
-        current_dataframe = df_clean
-        current_connection, table_name = load_csv_to_sqlite(df_clean)
-        
-        data_context, confidence, column_names = detect_data_type_and_context(df_clean)
-        
-        sample_data = df_clean.head(3).fillna("N/A").to_dict('records')
-        
-        logger.info(f"CSV uploaded successfully: {len(df_clean)} records, {len(df_clean.columns)} columns")
-        logger.info(f"Detected data context: {data_context} (confidence: {confidence:.2f})")
+        # The SQLite load, context detection and profiling are independent; run them together
+        (_, table_name), context_info, profile = await asyncio.gather(
+            run_in_threadpool(load_csv_to_sqlite, df_clean),
+            run_in_threadpool(detect_data_type_and_context, df_clean),
+            run_in_threadpool(build_dataset_profile, df_clean)
+        )
+        data_context, confidence, column_names = context_info
+        upload_generation += 1
+        upload = UploadState(
+            generation=upload_generation,
+            dataframe=df_clean,
+            table_name=table_name,
+            schema_fp=schema_fp,
+            profile=profile,
+            context=data_context,
+            confidence=confidence,
+            column_names=column_names
+        )
+        await run_in_threadpool(get_table_metadata_pooled, upload, table_name)
         
-        return {
+        # Build the response before touching any globals, so a failure here leaves the previous upload in place
+        response = {
             "success": True,
             "message": f"File uploaded successfully. Loaded {len(df_clean)} records with {len(df_clean.columns)} columns",
             "rows": len(df_clean),
             "columns": list(df_clean.columns),
-            "sample_data": sample_data,
+            "sample_data": profile.sample_records,
             "data_context": data_context,
             "context_confidence": confidence
         }
         
+        current_upload = upload
+        query_response_cache.clear()
+        for key in list(_metadata_cache):
+            if key[0] != upload.generation:
+                _metadata_cache.pop(key, None)
+        
+        logger.info(f"CSV uploaded successfully: {len(df_clean)} records, {len(df_clean.columns)} columns")
+        logger.info(f"Detected data context: {data_context} (confidence: {confidence:.2f})")
+        
+        return response
+        
     except Exception as e:
         logger.error(f"Error processing file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
@@ -685,66 +1260,186 @@ async def upload_csv(file: UploadFile = File(...)):
 async def get_sample_questions(api_key: Optional[str] = None):
     """Get contextual sample questions based on uploaded data"""
     
-    if current_dataframe is None:
+    upload = current_upload
+    if upload is None:
         raise HTTPException(status_code=400, detail="No data uploaded. Please upload a CSV file first.")
     
     try:
-        data_context, confidence, column_names = detect_data_type_and_context(current_dataframe)
-        
-        questions = generate_contextual_sample_questions(current_dataframe, data_context, api_key)
+        questions = sample_questions_cache.get(upload.schema_fp)
+        if questions is None:
+            questions, from_gemini = await generate_contextual_sample_questions(upload.dataframe, upload.context, api_key, upload.profile)
+            # Don't let a missing key or a failed Gemini call pin the fallback questions for 24 hours
+            if from_gemini:
+                sample_questions_cache[upload.schema_fp] = questions
+        else:
+            logger.info("Returning cached sample questions")
         
         return SampleQuestionsResponse(
             questions=questions,
-            data_type=data_context,
-            columns_analyzed=column_names
+            data_type=upload.context,
+            columns_analyzed=upload.column_names
         )
         
     except Exception as e:
         logger.error(f"Error generating sample questions: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating sample questions: {str(e)}")
 
+@app.get("/data/overview")
+async def get_data_overview():
+    """Summarize the uploaded dataset from the profile computed at upload"""
+    
+    upload = current_upload
+    if upload is None:
+        raise HTTPException(status_code=400, detail="No data uploaded. Please upload a CSV file first.")
+    
+    profile = upload.profile
+    return {
+        "rows": len(upload.dataframe),
+        "columns": list(upload.dataframe.columns),
+        "data_types": profile.dtypes_str,
+        "missing_values": profile.missing_counts,
+        "numeric_columns": profile.numeric_cols,
+        "categorical_columns": profile.categorical_cols,
+        "value_counts": profile.value_counts_top10_by_col,
+        "sample_data": profile.sample_records
+    }
+
 @app.post("/query", response_model=QueryResponse)
 async def process_query(request: QueryRequest):
     """Process natural language query and return results"""
     
-    if current_dataframe is None or current_connection is None:
+    upload = current_upload
+    if upload is None:
         raise HTTPException(status_code=400, detail="No data uploaded. Please upload a CSV file first.")
     
     try:
         logger.info(f"Processing query: {request.query}")
         
-        metadata = get_table_metadata(current_connection, request.table_name)
+        metadata = await get_cached_metadata(upload, request.table_name)
+        
+        # Check the semantic cache before generating SQL, so a hit costs only the embedding call
+        query_embedding = None
+        if request.use_cache:
+            query_embedding = await get_client(request.api_key).embed_text(request.query)
+            if query_embedding is not None:
+                cached = query_response_cache.lookup(query_embedding, request.table_name, request.query)
+                if cached is not None:
+                    return QueryResponse(
+                        success=cached.success,
+                        data=cached.data,
+                        columns=cached.columns,
+                        question=request.query,
+                        sql_query=cached.sql_query,
+                        message=f"Returned cached results for a similar question: \"{cached.question}\"",
+                        ai_summary=cached.ai_summary,
+                        truncated=cached.truncated
+                    )
         
-        sql_query = generate_sql_query_gemini(
+        sql_query = await generate_sql_query_gemini(
             request.query, 
             metadata, 
             request.table_name,
-            request.api_key
+            request.api_key,
+            request.use_cache
         )
         
-        data, columns = execute_query(current_connection, sql_query)
+        if sql_query and not is_read_only_select(sql_query):
+            raise HTTPException(status_code=400, detail="Generated SQL was rejected: only single SELECT queries are allowed")
+        
+        data, columns, truncated = await run_in_threadpool(execute_query_pooled, sql_query)
         
         # Generate AI-powered summary
         ai_summary = None
         if data:  # Only generate summary if there are results
-            ai_summary = generate_ai_summary(
+            ai_summary = await generate_ai_summary(
                 request.query,
                 data,
                 sql_query,
                 request.api_key
             )
         
-        return QueryResponse(
+        response = QueryResponse(
             success=True,
             data=data,
             columns=columns,
             question=request.query,
             sql_query=sql_query,
-            message=f"Query executed successfully. Found {len(data)} results.",
-            ai_summary=ai_summary
+            message=result_message(data, truncated),
+            ai_summary=ai_summary,
+            truncated=truncated
         )
+        # Skip caching if an upload replaced the data while this query ran
+        if query_embedding is not None and current_upload is upload:
+            query_response_cache.add(query_embedding, request.table_name, response)
+        return response
         
     except HTTPException:
         raise
     except Exception as e:
-        logger
\ No newline at end of file
+        logger.error(f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
+@app.post("/query/stream")
+async def process_query_stream(request: QueryRequest):
+    """Process a natural language query, streaming the SQL, result rows and summary as server-sent events.
+    Rows are buffered in full before the first rows event so the pooled connection is released before sending"""
+    
+    upload = current_upload
+    if upload is None:
+        raise HTTPException(status_code=400, detail="No data uploaded. Please upload a CSV file first.")
+    
+    logger.info(f"Processing streamed query: {request.query}")
+    
+    metadata = await get_cached_metadata(upload, request.table_name)
+    
+    sql_query = await generate_sql_query_gemini(
+        request.query,
+        metadata,
+        request.table_name,
+        request.api_key,
+        request.use_cache
+    )
+    if not sql_query:
+        raise HTTPException(status_code=500, detail="Could not generate a SQL query for this question")
+    if not is_read_only_select(sql_query):
+        raise HTTPException(status_code=400, detail="Generated SQL was rejected: only single SELECT queries are allowed")
+    
+    async def event_stream():
+        yield format_sse("sql", {"sql_query": sql_query})
+        
+        # Fetch everything before yielding, so a slow client never holds a pooled connection
+        try:
+            data, columns, truncated = await run_in_threadpool(execute_query_pooled, sql_query)
+        except Exception as e:
+            logger.error(f"SQL execution error: {str(e)}")
+            yield format_sse("error", {"message": f"SQL execution error: {str(e)}"})
+            return
+        
+        yield format_sse("columns", {"columns": columns})
+        for start in range(0, len(data), STREAM_BATCH_SIZE):
+            yield format_sse("rows", {"rows": data[start:start + STREAM_BATCH_SIZE]})
+        
+        client_to_use = get_client(request.api_key)
+        if data and client_to_use.client:
+            try:
+                prompt, system_prompt = await run_in_threadpool(build_summary_prompt, request.query, data)
+                async for text in clean_summary_stream(client_to_use.generate_response_stream(prompt, system_prompt)):
+                    yield format_sse("summary", {"text": text})
+            except Exception as e:
+                logger.error(f"Error streaming AI summary: {str(e)}")
+        
+        yield format_sse("done", {"message": result_message(data, truncated), "truncated": truncated})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+if __name__ == "__main__":
+    # Uploaded data lives in module globals, so keep one worker unless WEB_CONCURRENCY says otherwise;
+    # "auto" picks uvloop and httptools when uvicorn[standard] is installed
+    uvicorn.run(
+        "QBback:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="auto",
+        http="auto"
+    )